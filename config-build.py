@@ -16,10 +16,12 @@
 from __future__ import print_function
 
 import argparse
+import atexit
 import distutils.spawn
+import glob
+import hashlib
 import os
-import platform
-import shutil
+import shlex
 import stat
 import subprocess
 import sys
@@ -37,8 +39,7 @@ def extract_cmake_location(file_path):
           "Attempting to find cmake on your path...")
     cmake_path = distutils.spawn.find_executable("cmake")
     print("Found: {0}".format(cmake_path))
-    ret_cmake_path = "\"{0}\"".format(cmake_path)
-    return ret_cmake_path
+    return cmake_path
 
 
 def parse_arguments():
@@ -124,6 +125,20 @@ def parse_arguments():
         help="Select a specific host-config file to initalize CMake's cache",
     )
 
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Print the environment cmake will be run with.",
+    )
+
+    parser.add_argument(
+        "--force-reconfigure",
+        action="store_true",
+        help="Run cmake even if the host-config, arguments and source tree"
+        " are unchanged since the last successful configure.",
+    )
+
     parser.add_argument(
         "--docs-only",
         action="store_true",
@@ -166,10 +181,83 @@ def get_platform_info(hostconfigpath):
     return platform_info
 
 
+############################
+# Remove a directory tree
+############################
+def fast_rmtree(path):
+    try:
+        subprocess.check_call(rmtree_command(path))
+    except OSError:
+        # native removal tool is not available
+        scandir_rmtree(path)
+
+
+def scandir_rmtree(path):
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                scandir_rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+    os.rmdir(path)
+
+
+def rmtree_command(path):
+    if os.name == "nt":
+        return ["cmd", "/c", "rd", "/s", "/q", path]
+    return ["rm", "-rf", path]
+
+
+def rmtree_in_background(path):
+    trash = "%s.trash.%d" % (path, os.getpid())
+    try:
+        os.replace(path, trash)
+    except OSError:
+        fast_rmtree(path)
+        return
+
+    start_background_rmtree(trash)
+
+
+def start_background_rmtree(path):
+    # detach so that interrupting this script does not stop the removal
+    if os.name == "nt":
+        kwargs = {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    else:
+        kwargs = {"start_new_session": True}
+    try:
+        reaper = subprocess.Popen(rmtree_command(path), **kwargs)
+    except OSError:
+        fast_rmtree(path)
+        return
+
+    # AXOM_WAIT_CLEANUP=1 makes the script wait for the removal before exiting
+    if os.environ.get("AXOM_WAIT_CLEANUP") == "1":
+        atexit.register(reaper.wait)
+
+
+def remove_stale_trash(path):
+    for trash in glob.glob(glob.escape(path) + ".trash.*"):
+        print("Deleting stale directory '%s'..." % trash)
+        start_background_rmtree(trash)
+
+
+############################
+# Check for directory contents
+############################
+def has_contents(path):
+    try:
+        entries = os.scandir(path)
+    except OSError:
+        return False
+    with entries:
+        return next(entries, None) is not None
+
+
 #####################
 # Setup Build Dir
 #####################
-def setup_build_dir(args, platform_info):
+def get_build_path(args, platform_info):
     if args.buildpath != "":
         # use explicit build path
         buildpath = args.buildpath
@@ -180,14 +268,17 @@ def setup_build_dir(args, platform_info):
             pathList.append(args.buildtype.lower())
         buildpath = "-".join(pathList)
 
-    buildpath = os.path.abspath(buildpath)
+    return os.path.abspath(buildpath)
 
-    if os.path.exists(buildpath):
+
+def setup_build_dir(buildpath):
+    remove_stale_trash(buildpath)
+    if has_contents(buildpath):
         print("Build directory '%s' already exists.  Deleting..." % buildpath)
-        shutil.rmtree(buildpath)
+        rmtree_in_background(buildpath)
 
     print("Creating build directory '%s'..." % buildpath)
-    os.makedirs(buildpath)
+    os.makedirs(buildpath, exist_ok=True)
     return buildpath
 
 
@@ -197,7 +288,7 @@ def setup_build_dir(args, platform_info):
 def setup_install_dir(args, platform_info):
     # For install directory, we will clean up old ones, but we don't need to create it, cmake will do that.
     if args.installpath != "":
-        installpath = os.path.abspath(args.installpath)
+        installpath = args.installpath
     else:
         # use platform info & build type
         pathList = ["install", platform_info]
@@ -207,14 +298,13 @@ def setup_install_dir(args, platform_info):
 
     installpath = os.path.abspath(installpath)
 
-    if os.path.exists(installpath):
+    remove_stale_trash(installpath)
+    if has_contents(installpath):
         print(
             "Install directory '%s' already exists, deleting..." % installpath
         )
-        shutil.rmtree(installpath)
+        rmtree_in_background(installpath)
 
-    print("Creating install path '%s'..." % installpath)
-    os.makedirs(installpath)
     return installpath
 
 
@@ -227,22 +317,31 @@ def executable_exists(path):
     return os.path.isfile(path) and os.access(path, os.X_OK)
 
 
+############################
+# Format a command for the shell
+############################
+def format_command_line(argv):
+    if os.name == "nt":
+        return subprocess.list2cmdline(argv)
+    return " ".join(shlex.quote(arg) for arg in argv)
+
+
 ############################
 # Build CMake command line
 ############################
 def create_cmake_command_line(
     args, unknown_args, buildpath, hostconfigpath, installpath
 ):
-    cmakeline = extract_cmake_location(hostconfigpath)
-    cmakeline = os.path.normpath(cmakeline) # Fixes path for Windows
-    assert cmakeline != None, ("No cmake executable found on path")
-    assert executable_exists(cmakeline), (
+    cmake_exe = extract_cmake_location(hostconfigpath)
+    assert cmake_exe != None, ("No cmake executable found on path")
+    cmake_exe = os.path.normpath(cmake_exe) # Fixes path for Windows
+    assert executable_exists(cmake_exe), (
         "['%s'] invalid path to cmake executable or file does not have execute permissions"
-        % cmakeline
+        % cmake_exe
     )
 
     # create the ccmake command for convenience
-    cmakedir = os.path.dirname(cmakeline)
+    cmakedir = os.path.dirname(cmake_exe)
     ccmake_cmd = os.path.join(cmakedir, "ccmake")
     if executable_exists(ccmake_cmd):
         # write the ccmake command to a file to use for convenience
@@ -257,43 +356,45 @@ def create_cmake_command_line(
         os.chmod(ccmake_file, st.st_mode | stat.S_IEXEC)
 
     # Add cache file option
-    cmakeline = '"{0}" -C {1}'.format(cmakeline,hostconfigpath)
+    cmakeline = [cmake_exe, "-C", hostconfigpath]
     # Add build type (opt or debug); don't add for msvc generator
     if not args.msvc:
-        cmakeline += " -DCMAKE_BUILD_TYPE=" + args.buildtype
+        cmakeline.append("-DCMAKE_BUILD_TYPE=" + args.buildtype)
     # Set install dir
-    cmakeline += " -DCMAKE_INSTALL_PREFIX=%s" % installpath
+    cmakeline.append("-DCMAKE_INSTALL_PREFIX=%s" % installpath)
 
     if args.exportcompilercommands:
-        cmakeline += " -DCMAKE_EXPORT_COMPILE_COMMANDS=on"
+        cmakeline.append("-DCMAKE_EXPORT_COMPILE_COMMANDS=on")
 
     if args.eclipse:
-        cmakeline += ' -G "Eclipse CDT4 - Unix Makefiles"'
+        cmakeline.extend(["-G", "Eclipse CDT4 - Unix Makefiles"])
 
     if args.xcode:
-        cmakeline += ' -G "Xcode"'
+        cmakeline.extend(["-G", "Xcode"])
 
     if args.msvc:
-        cmakeline += ' -G "%s"' % args.msvcversions[args.msvc]
+        cmakeline.extend(["-G", args.msvcversions[args.msvc]])
         if args.generator_archs.get(args.msvc):
-            cmakeline += ' -A %s' % args.generator_archs[args.msvc]
+            cmakeline.extend(["-A", args.generator_archs[args.msvc]])
 
     if args.docs_only:
-        cmakeline += " -DENABLE_ALL_COMPONENTS=OFF"
-        cmakeline += " -DAXOM_ENABLE_TESTS=OFF"
-        cmakeline += " -DAXOM_ENABLE_EXAMPLES=OFF"
-        cmakeline += " -DAXOM_ENABLE_DOCS=ON"
+        cmakeline.extend([
+            "-DENABLE_ALL_COMPONENTS=OFF",
+            "-DAXOM_ENABLE_TESTS=OFF",
+            "-DAXOM_ENABLE_EXAMPLES=OFF",
+            "-DAXOM_ENABLE_DOCS=ON",
+        ])
 
     if unknown_args:
-        cmakeline += " " + " ".join(unknown_args)
+        cmakeline.extend(unknown_args)
 
     rootdir = os.path.dirname(os.path.abspath(sys.argv[0]))
-    cmakeline += " %s " % os.path.join(rootdir, "src")
+    cmakeline.append(os.path.join(rootdir, "src"))
 
     # Dump the cmake command to file for convenience
     cmake_file = os.path.join(buildpath, "cmake_cmd")
     with open(cmake_file, "w") as cmdfile:
-        cmdfile.write(cmakeline)
+        cmdfile.write(format_command_line(cmakeline))
         cmdfile.write("\n")
 
     st = os.stat(cmake_file)
@@ -301,16 +402,65 @@ def create_cmake_command_line(
     return cmakeline
 
 
+############################
+# Configure fingerprint
+############################
+def get_fingerprint_file(buildpath):
+    return os.path.join(buildpath, ".axom_configure_fp")
+
+
+def compute_configure_fingerprint(hostconfigpath):
+    # hash the host-config contents, script arguments and CMakeLists.txt mtime
+    rootdir = os.path.dirname(os.path.abspath(sys.argv[0]))
+    cmakelists = os.path.join(rootdir, "src", "CMakeLists.txt")
+
+    sha = hashlib.sha1()
+    with open(hostconfigpath, "rb") as hostconfig:
+        sha.update(hostconfig.read())
+    # options that do not affect the configure are left out of the hash
+    ignored_args = ("--force-reconfigure", "-v", "--verbose")
+    script_args = [arg for arg in sys.argv[1:] if arg not in ignored_args]
+    sha.update(repr(script_args).encode())
+    sha.update(repr((cmakelists, os.path.getmtime(cmakelists))).encode())
+    return sha.hexdigest()
+
+
+def is_configure_up_to_date(buildpath, fingerprint):
+    try:
+        with open(get_fingerprint_file(buildpath), "r") as fpfile:
+            return fpfile.read().strip() == fingerprint
+    except (IOError, OSError):
+        return False
+
+
+def write_configure_fingerprint(buildpath, fingerprint):
+    with open(get_fingerprint_file(buildpath), "w") as fpfile:
+        fpfile.write(fingerprint)
+        fpfile.write("\n")
+
+
+############################
+# Print Environment
+############################
+def print_environment():
+    # Format the whole environment up front and emit it with a single write
+    lines = ["Environment:"]
+    lines.extend("  %s=%s" % item for item in sorted(os.environ.items()))
+    lines.append("")
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
 ############################
 # Run CMake
 ############################
 def run_cmake(buildpath, cmakeline):
     print("Changing to build directory...")
     os.chdir(buildpath)
-    print("Executing CMake line: '%s'" % cmakeline)
+    print("Executing CMake line: '%s'" % format_command_line(cmakeline))
     print("")
 
-    returncode = subprocess.call(cmakeline, shell=True)
+    returncode = subprocess.call(cmakeline)
     if not returncode == 0:
         print(
             "Error: CMake command failed with return code: {0}".format(
@@ -329,13 +479,28 @@ def main():
 
     hostconfigpath = find_host_config(args)
     platform_info = get_platform_info(hostconfigpath)
-    buildpath = setup_build_dir(args, platform_info)
+    buildpath = get_build_path(args, platform_info)
+
+    fingerprint = compute_configure_fingerprint(hostconfigpath)
+    if not args.force_reconfigure and is_configure_up_to_date(
+        buildpath, fingerprint
+    ):
+        print("Configure of '%s' is up-to-date, skipping cmake." % buildpath)
+        return True
+
+    setup_build_dir(buildpath)
     installpath = setup_install_dir(args, platform_info)
 
     cmakeline = create_cmake_command_line(
         args, unknown_args, buildpath, hostconfigpath, installpath
     )
-    return run_cmake(buildpath, cmakeline)
+    if args.verbose:
+        print_environment()
+    if not run_cmake(buildpath, cmakeline):
+        return False
+
+    write_configure_fingerprint(buildpath, fingerprint)
+    return True
 
 
 if __name__ == "__main__":
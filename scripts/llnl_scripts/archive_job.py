@@ -1,5 +1,5 @@
 #!/bin/sh
-"exec" "python" "-u" "-B" "$0" "$@"
+"exec" "python3" "-u" "-B" "$0" "$@"
 
 # Copyright (c) 2017-2022, Lawrence Livermore National Security, LLC and
 # other Axom Project Developers. See the top-level LICENSE file for details.
@@ -68,9 +68,9 @@ def main():
 
     cwd = os.getcwd()
 
-    print "[Starting Archiving]"
-    print "[  Archive Dir: %s]" % archive_dir
-    print "[  Job Dir: %s]" % cwd
+    print("[Starting Archiving]")
+    print("[  Archive Dir: %s]" % archive_dir)
+    print("[  Job Dir: %s]" % cwd)
 
     # Create a success/failure file if not already created by the job
     if (opts["exitcode"] != 0) and not os.path.exists("failed.json"):
@@ -44,6 +44,12 @@ def parse_args():
                       dest="testserial",
                       default=False,
                       help="Run unit tests serially")
+    # Build host-configs concurrently
+    parser.add_option("-j", "--jobs-per-config",
+                      type="int",
+                      dest="jobs_per_config",
+                      default=0,
+                      help="Number of make jobs per host-config. When building all host-configs, also builds them concurrently (Defaults to building serially with 16 make jobs)")
     # Extra cmake options to pass to config build
     parser.add_option("--extra-cmake-options",
                       dest="extra_cmake_options",
@@ -72,6 +78,11 @@ def parse_args():
         print("[ERROR: automation and host-config modes are mutually exclusive]")
         sys.exit(1)
 
+    build_all = not opts["hostconfig"] and not opts["automation"]
+    if build_all and opts["verbose"] and opts["jobs_per_config"] > 0:
+        print("[ERROR: verbose output is not supported when building all host-configs concurrently]")
+        sys.exit(1)
+
     return opts
 
 
@@ -99,6 +110,11 @@ def main():
         os.chdir(repo_dir)
         timestamp = get_timestamp()
 
+        # Only override the default number of make jobs when given
+        make_jobs_opts = {}
+        if opts["jobs_per_config"] > 0:
+            make_jobs_opts["make_jobs"] = opts["jobs_per_config"]
+
         # Default to build all SYS_TYPE's host-configs in host-config/
         build_all = not opts["hostconfig"] and not opts["automation"]
         if build_all:
@@ -106,7 +122,9 @@ def main():
                                               report_to_stdout = opts["verbose"],
                                               extra_cmake_options = opts["extra_cmake_options"],
                                               build_type = opts["buildtype"],
-                                              test_serial = opts["testserial"])
+                                              test_serial = opts["testserial"],
+                                              build_concurrently = opts["jobs_per_config"] > 0,
+                                              **make_jobs_opts)
         # Otherwise try to build a specific host-config
         else:
             # Command-line arg has highest priority
@@ -121,11 +139,8 @@ def main():
                 if not "COMPILER" in os.environ:
                     print("[ERROR: Automation mode required 'COMPILER' environment variable]")
                     return 1
-                import socket
-                hostname = socket.gethostname()
-                # Remove any numbers after the end
-                hostname = hostname.rstrip('0123456789')
-                sys_type = os.environ["SYS_TYPE"]
+                hostname = get_machine_name()
+                sys_type = get_system_type()
                 # Remove everything including and after the last hyphen
                 sys_type = sys_type.rsplit('-', 1)[0]
                 compiler = os.environ["COMPILER"]
@@ -159,7 +174,8 @@ def main():
                                              report_to_stdout = opts["verbose"],
                                              extra_cmake_options = opts["extra_cmake_options"],
                                              build_type = opts["buildtype"],
-                                             test_serial = opts["testserial"])
+                                             test_serial = opts["testserial"],
+                                             **make_jobs_opts)
 
     finally:
         os.chdir(original_wd)
@@ -19,6 +19,8 @@ import datetime
 import glob
 import json
 import getpass
+import multiprocessing
+import shlex
 import shutil
 import time
 
@@ -42,12 +44,12 @@ def sexe(cmd,
             res = res.decode()
         return p.returncode,res
     elif output_file != None:
-        ofile = open(output_file,"w")
-        p = subprocess.Popen(cmd,
-                             shell=True,
-                             stdout= ofile,
-                             stderr=subprocess.STDOUT)
-        res =p.communicate()[0]
+        with open(output_file,"w") as ofile:
+            p = subprocess.Popen(cmd,
+                                 shell=True,
+                                 stdout= ofile,
+                                 stderr=subprocess.STDOUT)
+            p.wait()
         return p.returncode
     else:
         rcode = subprocess.call(cmd,shell=True)
@@ -56,6 +58,13 @@ def sexe(cmd,
         return rcode
 
 
+def print_file(path):
+    """ Streams the contents of a file to stdout without reading it all at once. """
+    with open(path, "r") as f:
+        shutil.copyfileobj(f, sys.stdout)
+    sys.stdout.flush()
+
+
 def get_timestamp(t=None,sep="_"):
     """ Creates a timestamp that can easily be included in a filename. """
     if t is None:
@@ -153,18 +162,27 @@ def uberenv_create_mirror(prefix, spec, project_file, mirror_path):
     return res
 
 
-def uberenv_build(prefix, spec, project_file, mirror_path):
+def uberenv_build(prefix, spec, project_file, mirror_path, repo_dir = None, log_dir = None):
     """
     Calls uberenv to install tpls for a given spec to given prefix.
+
+    If repo_dir is given, the uberenv of that source tree is used instead of
+    the one in this repository. Logs and failure records are written to
+    log_dir, which defaults to prefix.
     """
     assertUberenvExists()
-    cmd  = "{0} {1} -k ".format(sys.executable, get_uberenv_path())
+    if repo_dir is None:
+        repo_dir = get_repo_dir()
+    if log_dir is None:
+        log_dir = prefix
+    uberenv_path = pjoin(repo_dir, "scripts", "uberenv", "uberenv.py")
+    cmd  = "{0} {1} -k ".format(sys.executable, uberenv_path)
     cmd += "--prefix=\"{0}\" --spec=\"{1}\" ".format(prefix, spec)
     cmd += "--mirror=\"{0}\" ".format(mirror_path)
     if project_file:
         cmd += "--project-json=\"{0}\" ".format(project_file)
 
-    spack_tpl_build_log = pjoin(prefix,"output.log.spack.tpl.build.%s.txt" % spec.replace(" ", "_"))
+    spack_tpl_build_log = pjoin(log_dir,"output.log.spack.tpl.build.%s.txt" % spec.replace(" ", "_"))
     print("[starting tpl install of spec %s]" % spec)
     print("[log file: %s]" % spack_tpl_build_log)
     res = sexe(cmd,
@@ -173,15 +191,14 @@ def uberenv_build(prefix, spec, project_file, mirror_path):
 
     # Move files generated by spack in source directory to TPL install directory
     print("[Moving spack generated files to TPL build directory]")
-    repo_dir = get_repo_dir()
     for file in ["spack-build-env.txt", "spack-build-out.txt", "spack-configure-args.txt"]:
         src = pjoin(repo_dir, file)
-        dst = pjoin(prefix, "{0}-{1}".format(spec.replace(" ", "_"),file))
+        dst = pjoin(log_dir, "{0}-{1}".format(spec.replace(" ", "_"),file))
         if os.path.exists(src) and not os.path.exists(dst):
             shutil.move(src, dst)
 
     if res != 0:
-        log_failure(prefix,"[ERROR: uberenv/spack build of spec: %s failed]" % spec)
+        log_failure(log_dir,"[ERROR: uberenv/spack build of spec: %s failed]" % spec)
     return res
 
 
@@ -193,29 +210,40 @@ def build_and_test_host_config(test_root, host_config,
                                report_to_stdout = False,
                                extra_cmake_options = "",
                                build_type = "Debug",
-                               test_serial = False):
+                               test_serial = False,
+                               make_jobs = 16):
     host_config_root = get_host_config_root(host_config)
+
+    # prefix output with the host-config so concurrent builds can be told apart
+    def log(msg):
+        print("[%s] %s" % (host_config_root, msg))
+
     # setup build and install dirs
     build_dir   = pjoin(test_root,"build-%s"   % host_config_root)
     install_dir = pjoin(test_root,"install-%s" % host_config_root)
-    print("[Testing build, test, and install of host config file: %s]" % host_config)
-    print("[ build dir: %s]"   % build_dir)
-    print("[ install dir: %s]" % install_dir)
+    log("[Testing build, test, and install of host config file: %s]" % host_config)
+    log("[ build dir: %s]"   % build_dir)
+    log("[ install dir: %s]" % install_dir)
 
     # configure
     cfg_output_file = pjoin(test_root,"output.log.%s.configure.txt" % host_config_root)
-    print("[starting configure of %s]" % host_config)
-    print("[log file: %s]" % cfg_output_file)
-    res = sexe("%s config-build.py -bp %s -ip %s -bt %s -hc %s %s" % (sys.executable, build_dir, install_dir, build_type, host_config, extra_cmake_options),
+    log("[starting configure of %s]" % host_config)
+    log("[log file: %s]" % cfg_output_file)
+    # extra cmake options are left for the shell to expand and split
+    cfg_args = [sys.executable, "-u", "-B", "config-build.py",
+                "-bp", build_dir, "-ip", install_dir,
+                "-bt", build_type, "-hc", host_config]
+    cfg_cmd = " ".join(shlex.quote(arg) for arg in cfg_args)
+    cfg_cmd += " " + extra_cmake_options
+    res = sexe(cfg_cmd,
                output_file = cfg_output_file,
                echo=True)
 
     if report_to_stdout:
-        with open(cfg_output_file, 'r') as build_out:
-            print(build_out.read())
+        print_file(cfg_output_file)
 
     if res != 0:
-        print("[ERROR: Configure for host-config: %s failed]\n" % host_config)
+        log("[ERROR: Configure for host-config: %s failed]\n" % host_config)
         return res
 
     ####
@@ -224,26 +252,25 @@ def build_and_test_host_config(test_root, host_config,
 
     # build the code
     bld_output_file =  pjoin(build_dir,"output.log.make.txt")
-    print("[starting build]")
-    print("[log file: %s]" % bld_output_file)
-    res = sexe("cd %s && make -j 16 VERBOSE=1 " % build_dir,
+    log("[starting build]")
+    log("[log file: %s]" % bld_output_file)
+    res = sexe("cd %s && make -j %d VERBOSE=1 " % (build_dir, make_jobs),
                 output_file = bld_output_file,
                 echo=True)
 
     if report_to_stdout:
-        with open(bld_output_file, 'r') as build_out:
-            print(build_out.read())
+        print_file(bld_output_file)
 
     if res != 0:
-        print("[ERROR: Build for host-config: %s failed]\n" % host_config)
+        log("[ERROR: Build for host-config: %s failed]\n" % host_config)
         return res
 
     # test the code
     tst_output_file = pjoin(build_dir,"output.log.make.test.txt")
-    print("[starting unit tests]")
-    print("[log file: %s]" % tst_output_file)
+    log("[starting unit tests]")
+    log("[log file: %s]" % tst_output_file)
 
-    parallel_test = "" if test_serial else "-j16"
+    parallel_test = "" if test_serial else "-j%d" % make_jobs
     tst_cmd = "cd %s && make CTEST_OUTPUT_ON_FAILURE=1 test ARGS=\"--no-compress-output -T Test -VV %s\"" % (build_dir, parallel_test)
 
     res = sexe(tst_cmd,
@@ -251,61 +278,59 @@ def build_and_test_host_config(test_root, host_config,
                echo=True)
 
     if report_to_stdout:
-        with open(tst_output_file, 'r') as test_out:
-            print(test_out.read())
+        print_file(tst_output_file)
 
     # Convert CTest output to JUnit, do not overwrite previous res
-    print("[Checking to see if xsltproc exists...]")
+    log("[Checking to see if xsltproc exists...]")
     test_xsltproc_res = sexe("xsltproc --version", echo=True)
     if test_xsltproc_res != 0:
-        print("[WARNING: xsltproc does not exist skipping JUnit conversion]")
+        log("[WARNING: xsltproc does not exist skipping JUnit conversion]")
     else:
         junit_file = pjoin(build_dir, "junit.xml")
         xsl_file = pjoin(get_blt_dir(), "tests/ctest-to-junit.xsl")
         ctest_file = pjoin(build_dir, "Testing/*/Test.xml")
 
-        print("[Converting CTest XML to JUnit XML]")
+        log("[Converting CTest XML to JUnit XML]")
         convert_cmd  = "xsltproc -o {0} {1} {2}".format(junit_file, xsl_file, ctest_file)
         convert_res = sexe(convert_cmd, echo=True)
         if convert_res != 0:
-            print("[WARNING: Converting to JUnit failed.]")
+            log("[WARNING: Converting to JUnit failed.]")
 
     if res != 0:
-        print("[ERROR: Tests for host-config: %s failed]\n" % host_config)
+        log("[ERROR: Tests for host-config: %s failed]\n" % host_config)
         return res
 
     # build the docs
     docs_output_file = pjoin(build_dir,"output.log.make.docs.txt")
-    print("[starting docs generation]")
-    print("[log file: %s]" % docs_output_file)
+    log("[starting docs generation]")
+    log("[log file: %s]" % docs_output_file)
 
-    res = sexe("cd %s && make -j16 docs " % build_dir,
+    res = sexe("cd %s && make -j%d docs " % (build_dir, make_jobs),
                output_file = docs_output_file,
                echo=True)
 
     if report_to_stdout:
-        with open(docs_output_file, 'r') as docs_out:
-            print(docs_out.read())
+        print_file(docs_output_file)
 
     if res != 0:
-        print("[ERROR: Docs generation for host-config: %s failed]\n\n" % host_config)
+        log("[ERROR: Docs generation for host-config: %s failed]\n\n" % host_config)
         return res
 
     # install the code
     inst_output_file = pjoin(build_dir,"output.log.make.install.txt")
-    print("[starting install]")
-    print("[log file: %s]" % inst_output_file)
+    log("[starting install]")
+    log("[log file: %s]" % inst_output_file)
 
-    res = sexe("cd %s && make -j16 install " % build_dir,
+    res = sexe("cd %s && make -j%d install " % (build_dir, make_jobs),
                output_file = inst_output_file,
                echo=True)
 
     if res != 0:
-        print("[ERROR: Install for host-config: %s failed]\n\n" % host_config)
+        log("[ERROR: Install for host-config: %s failed]\n\n" % host_config)
         return res
 
     # simple sanity check for make install
-    print("[checking install dir %s]" % install_dir)
+    log("[checking install dir %s]" % install_dir)
     sexe("ls %s/include" % install_dir, echo=True, error_prefix="WARNING:")
     sexe("ls %s/lib" %     install_dir, echo=True, error_prefix="WARNING:")
     sexe("ls %s/bin" %     install_dir, echo=True, error_prefix="WARNING:")
@@ -321,8 +346,8 @@ def build_and_test_host_config(test_root, host_config,
     if should_test_installed_cmake_example:
         install_example_dir = pjoin(install_dir, "examples", "axom", "using-with-cmake")
         install_example_output_file = pjoin(build_dir,"output.log.install_example.cmake.txt")
-        print("[testing installed 'using-with-cmake' example]")
-        print("[log file: %s]" % install_example_output_file)
+        log("[testing installed 'using-with-cmake' example]")
+        log("[log file: %s]" % install_example_output_file)
 
         example_commands = [
             "cd {0}".format(install_example_dir),
@@ -343,15 +368,15 @@ def build_and_test_host_config(test_root, host_config,
                 echo=True)
 
         if res != 0:
-            print("[ERROR: Installed 'using-with-cmake' example for host-config: %s failed]\n\n" % host_config)
+            log("[ERROR: Installed 'using-with-cmake' example for host-config: %s failed]\n\n" % host_config)
             return res
 
 
     if should_test_installed_blt_example:
         install_example_dir = pjoin(install_dir, "examples", "axom", "using-with-blt")
         install_example_output_file = pjoin(build_dir,"output.log.install_example.blt.txt")
-        print("[testing installed 'using-with-blt' example]")
-        print("[log file: %s]" % install_example_output_file)
+        log("[testing installed 'using-with-blt' example]")
+        log("[log file: %s]" % install_example_output_file)
 
         example_commands = [
             "cd {0}".format(install_example_dir),
@@ -372,11 +397,11 @@ def build_and_test_host_config(test_root, host_config,
                 echo=True)
 
         if res != 0:
-            print("[ERROR: Installed 'using-with-blt' example for host-config: %s failed]\n\n" % host_config)
+            log("[ERROR: Installed 'using-with-blt' example for host-config: %s failed]\n\n" % host_config)
             return res
 
 
-    print("[SUCCESS: Build, test, and install for host-config: %s complete]\n" % host_config)
+    log("[SUCCESS: Build, test, and install for host-config: %s complete]\n" % host_config)
 
     set_group_and_perms(build_dir)
     set_group_and_perms(install_dir)
@@ -390,7 +415,16 @@ def build_and_test_host_configs(prefix,
                                 report_to_stdout = False,
                                 extra_cmake_options = "",
                                 build_type = "Debug",
-                                test_serial = False):
+                                test_serial = False,
+                                make_jobs = 16,
+                                build_concurrently = False):
+    """
+    Builds and tests all host-configs for the current machine.
+
+    If build_concurrently is set, host-configs are built at the same time, as many
+    as fit on the node with make_jobs make jobs each. Otherwise they are
+    built one after another.
+    """
     host_configs = get_host_configs_for_current_machine(prefix, use_generated_host_configs)
     if len(host_configs) == 0:
         log_failure(prefix,"[ERROR: No host configs found at %s]" % prefix)
@@ -403,24 +437,36 @@ def build_and_test_host_configs(prefix,
     test_root =  get_build_and_test_root(prefix, timestamp)
     os.mkdir(test_root)
     write_build_info(pjoin(test_root,"info.json")) 
-    ok  = []
-    bad = []
-    for host_config in host_configs:
+
+    def build_one(host_config):
         build_dir = get_build_dir(test_root, host_config)
 
         start_time = time.time()
-        if build_and_test_host_config(test_root, host_config,
-                                      report_to_stdout = report_to_stdout,
-                                      extra_cmake_options=extra_cmake_options,
-                                      build_type = build_type,
-                                      test_serial = test_serial) == 0:
-            ok.append(host_config)
+        res = build_and_test_host_config(test_root, host_config,
+                                         report_to_stdout = report_to_stdout,
+                                         extra_cmake_options=extra_cmake_options,
+                                         build_type = build_type,
+                                         test_serial = test_serial,
+                                         make_jobs = make_jobs)
+        if res == 0:
             log_success(build_dir, "[Success: Built host-config: {0}]".format(host_config), timestamp)
         else:
-            bad.append(host_config)
             log_failure(build_dir, "[Error: Failed to build host-config: {0}]".format(host_config), timestamp)
         end_time = time.time()
-        print("[build time: {0}]\n".format(convertSecondsToReadableTime(end_time - start_time)))
+        print("[build time of {0}: {1}]\n".format(host_config, convertSecondsToReadableTime(end_time - start_time)))
+        return res
+
+    if build_concurrently:
+        import concurrent.futures
+        max_workers = max(1, multiprocessing.cpu_count() // make_jobs)
+        print("[Building up to {0} host-configs concurrently with make -j{1}]".format(max_workers, make_jobs))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(build_one, host_configs))
+    else:
+        results = [build_one(host_config) for host_config in host_configs]
+
+    ok  = [hc for hc, res in zip(host_configs, results) if res == 0]
+    bad = [hc for hc, res in zip(host_configs, results) if res != 0]
 
     # Log overall job success/failure
     if len(bad) != 0:
@@ -470,6 +516,58 @@ def set_group_and_perms(directory):
     return 0
 
 
+def build_tpls_for_spec(prefix, spec, mirror_dir, repo_dir = None, log_dir = None):
+    """
+    Uses uberenv to install tpls for a single spec and reports the build time.
+    """
+    start_time = time.time()
+    fullspec = "{0}".format(spec)
+    res = uberenv_build(prefix, fullspec, "", mirror_dir, repo_dir, log_dir)
+    end_time = time.time()
+    print("[build time: {0}]".format(convertSecondsToReadableTime(end_time - start_time)))
+    if res != 0:
+        print("[ERROR: Failed build of tpls for spec %s]\n" % spec)
+    else:
+        print("[SUCCESS: Finished build tpls for spec %s]\n" % spec)
+    return res
+
+
+def build_tpls_for_spec_in_copy(builds_dir, prefix, index, spec, mirror_dir):
+    """
+    Builds tpls for a spec with its own uberenv prefix and copy of the
+    source tree, so concurrent builds share neither a spack instance nor
+    the files spack writes into the source directory.
+
+    Logs and the generated host-config end up in prefix, as for a serial
+    build, and the source copy is removed afterwards.
+    """
+    spec_prefix = pjoin(prefix, "spec_%d" % index)
+    spec_repo_dir = pjoin(spec_prefix, "axom")
+
+    ignore_patterns = shutil.ignore_patterns(".git", "data",
+                                             "_axom_build_and_test_*",
+                                             "build-*", "install-*")
+    def ignore(src, names):
+        # never copy the builds directory into itself
+        ignored = set(ignore_patterns(src, names))
+        ignored.update(name for name in names
+                       if os.path.abspath(pjoin(src, name)) == builds_dir)
+        return ignored
+
+    print("[Copying source tree for spec %s to %s]" % (spec, spec_repo_dir))
+    shutil.copytree(get_repo_dir(), spec_repo_dir, symlinks=True, ignore=ignore)
+
+    try:
+        res = build_tpls_for_spec(spec_prefix, spec, mirror_dir, spec_repo_dir, prefix)
+
+        for host_config in get_host_configs_for_current_machine(spec_repo_dir, True):
+            shutil.copy2(host_config, prefix)
+    finally:
+        print("[Removing source tree copy %s]" % spec_repo_dir)
+        shutil.rmtree(spec_repo_dir)
+    return res
+
+
 def full_build_and_test_of_tpls(builds_dir, timestamp, spec, report_to_stdout = False, mirror_location = ''):
     if spec:
         specs = [spec]
@@ -508,19 +606,22 @@ def full_build_and_test_of_tpls(builds_dir, timestamp, spec, report_to_stdout =
         os.remove(host_config)
 
     # use uberenv to install for all specs
-    tpl_build_failed = False
-    for spec in specs:
-        start_time = time.time()
-        fullspec = "{0}".format(spec)
-        res = uberenv_build(prefix, fullspec, "", mirror_dir)
-        end_time = time.time()
-        print("[build time: {0}]".format(convertSecondsToReadableTime(end_time - start_time)))
-        if res != 0:
-            print("[ERROR: Failed build of tpls for spec %s]\n" % spec)
-            tpl_build_failed = True
-            break
-        else:
-            print("[SUCCESS: Finished build tpls for spec %s]\n" % spec)
+    results = []
+    if use_parallel_tpl_builds():
+        import concurrent.futures
+        # spack builds each package with up to 16 jobs by default
+        max_workers = max(1, min(len(specs), multiprocessing.cpu_count() // 16))
+        print("[Building tpls for up to {0} specs concurrently]".format(max_workers))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(lambda args: build_tpls_for_spec_in_copy(builds_dir, prefix, args[0], args[1], mirror_dir),
+                                        enumerate(specs)))
+    else:
+        for spec in specs:
+            results.append(build_tpls_for_spec(prefix, spec, mirror_dir))
+            if results[-1] != 0:
+                break
+    res = next((r for r in results if r != 0), 0)
+    tpl_build_failed = res != 0
 
     # Copy generated host-configs into TPL install directory
     print("[Copying spack generated host-configs to TPL build directory]")
@@ -666,12 +767,23 @@ def get_build_and_test_root(prefix, timestamp):
     return pjoin(prefix, dirname)
 
 
+# Machine and SYS_TYPE detection results, looked up once per process
+_machine_name = None
+_system_type = None
+
+
 def get_machine_name():
-    return socket.gethostname().rstrip('1234567890')
+    global _machine_name
+    if _machine_name is None:
+        _machine_name = socket.gethostname().rstrip('1234567890')
+    return _machine_name
 
 
 def get_system_type():
-    return os.environ["SYS_TYPE"]
+    global _system_type
+    if _system_type is None:
+        _system_type = os.environ["SYS_TYPE"]
+    return _system_type
 
 
 def get_platform():
@@ -682,6 +794,10 @@ def get_username():
     return getpass.getuser()
 
 
+def use_parallel_tpl_builds():
+    return os.environ.get("AXOM_PARALLEL_TPL") == "1"
+
+
 def get_shared_base_dir():
     return "/usr/WS1/axom"
 
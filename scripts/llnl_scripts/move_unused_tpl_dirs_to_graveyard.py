@@ -1,5 +1,5 @@
 #!/bin/sh
-"exec" "python" "-u" "-B" "$0" "$@"
+"exec" "python3" "-u" "-B" "$0" "$@"
 
 # Copyright (c) 2017-2022, Lawrence Livermore National Security, LLC and
 # other Axom Project Developers. See the top-level LICENSE file for details.
@@ -40,16 +40,16 @@ def main():
 
     summary_file ="tpl_dirs_summary.json"
     if not os.path.exists(summary_file):
-        print("Error: Summary file from find_unused_tpl_dirs.py did not exist: {0}", summary_file)
+        print("Error: Summary file from find_unused_tpl_dirs.py did not exist: {0}".format(summary_file))
         return False
 
     r = json.load(open(summary_file))
 
-    print ""
-    print "[# of referenced %d ]" % len(r["referenced"])
-    print "[# of found %d ]" % len(r["found"])
-    print "[# of active %d ]" % len(r["active"])
-    print "[# of unused %d ]" % len(r["unused"])
+    print("")
+    print("[# of referenced %d ]" % len(r["referenced"]))
+    print("[# of found %d ]" % len(r["found"]))
+    print("[# of active %d ]" % len(r["active"]))
+    print("[# of unused %d ]" % len(r["unused"]))
 
     success = True
     for d in r["unused"]:
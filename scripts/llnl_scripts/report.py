@@ -1,5 +1,5 @@
 #!/bin/sh
-"exec" "python" "-u" "-B" "$0" "$@"
+"exec" "python3" "-u" "-B" "$0" "$@"
 
 # Copyright (c) 2017-2022, Lawrence Livermore National Security, LLC and
 # other Axom Project Developers. See the top-level LICENSE file for details.
@@ -28,7 +28,10 @@ except ImportError:
 
 from optparse import OptionParser
 from smtplib import SMTP
-from email.MIMEText import MIMEText
+try:
+    from email.mime.text import MIMEText
+except ImportError:
+    from email.MIMEText import MIMEText
 from dateutil.parser import parse
 from llnl_lc_build_tools import *
 
@@ -109,17 +112,17 @@ def main():
         cleanOldArchives(archive_dir)
 
     #Generate build email and send
-    print "Reading archived job information..."
+    print("Reading archived job information...")
     basicJobInfos, srcJobInfos, tplJobInfos = generateJobInfos(archive_dir)
 
-    print "Generating email content..."
+    print("Generating email content...")
     emailContent = generateEmailContent(basicJobInfos, srcJobInfos, tplJobInfos)
     
-    print "Saving html file '{}'".format( opts["html"] )
+    print("Saving html file '{}'".format( opts["html"] ))
     with open(opts["html"], 'w') as f:
         f.write(emailContent)
 
-    print "Sending email to {}...".format(opts["email"])
+    print("Sending email to {}...".format(opts["email"]))
     return sendEmail(emailContent, emailSubject, sender, receiver, emailServer)
 
 
@@ -128,7 +131,7 @@ def getAllDirectoryNames(path):
 
 
 def cleanOldArchives(archive_dir):
-    print "Deleting old archive directories..."    
+    print("Deleting old archive directories...")
 
     # Remove only the individual jobs not any of the directory structure
     # Directory structure = <archive base>/<sys_type>/<job name>/<datetime>
@@ -147,7 +150,7 @@ def cleanOldArchives(archive_dir):
                 datetime_dir = pjoin(jobName_dir, datetime)
                 shutil.rmtree(datetime_dir)
 
-    print "Done deleting."
+    print("Done deleting.")
 
 
 def determineSuccessState(path):
@@ -208,8 +211,8 @@ def generateJobInfos(archive_dir):
                 currSpecInfo.success = determineSuccessState(spec_dir)
 
                 populateTests(currSpecInfo, spec_dir)
-                if currJobInfo.specInfos.has_key(currSpecInfo.name):
-                    print "Warning: duplicate spec ({0}) found in job: {1}".format(spec, currJobInfo.name)
+                if currSpecInfo.name in currJobInfo.specInfos:
+                    print("Warning: duplicate spec ({0}) found in job: {1}".format(spec, currJobInfo.name))
                 currJobInfo.specInfos[spec] = currSpecInfo
 
                 currJobInfo.success = True
@@ -245,7 +248,7 @@ def populateTests(specInfo, path):
 
     for test_elem in tree.iter(tag="Test"):
         # Skip the list of test names @ Site -> Testing -> TestList -> Test
-        if not test_elem.attrib.has_key("Status"):
+        if not "Status" in test_elem.attrib:
             continue
 
         name = ""
@@ -254,14 +257,14 @@ def populateTests(specInfo, path):
                 name = child_elem.text
                 break
         if name == "":
-            print "Error: {0}: Unknown to find test name".format(test_xml_path)
+            print("Error: {0}: Unknown to find test name".format(test_xml_path))
 
         if test_elem.attrib["Status"] == "passed":
             specInfo.passed.append(name)
         elif test_elem.attrib["Status"] == "failed":
             specInfo.failed.append(name)
         else:
-            print "Error: {0}: Unknown test status ({1})".format(test_xml_path, test_elem.attrib["Status"])
+            print("Error: {0}: Unknown test status ({1})".format(test_xml_path, test_elem.attrib["Status"]))
 
 
 def generateEmailContent(basicJobInfos, srcJobInfos, tplJobInfos):
@@ -424,9 +427,9 @@ def sendEmail(content, subject, sender, receiver, emailServer):
         finally:
             conn.close()
     except Exception as e:
-        print "Failed to send email:\n {0}".format(str(e))
+        print("Failed to send email:\n {0}".format(str(e)))
         return False
-    print "Sent."
+    print("Sent.")
 
     return True
 